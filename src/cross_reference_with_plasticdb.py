@@ -1,112 +1,346 @@
 #!/usr/bin/env python3
 import argparse
-from Bio import SeqIO
-import hashlib
+from array import array
+import numpy as np
+from numba import njit
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
 import time
 
+CHUNK_SIZE = 1 << 20
+WRITE_BATCH_SIZE = 4096
+SHARDS_PER_WORKER = 8
 
-def create_plasticdb_lookup(plasticdb_file, verify_exact=False, no_duplicates=False):
+FNV_OFFSET_BASIS = np.uint64(14695981039346656037)
+FNV_PRIME = np.uint64(1099511628211)
+
+# Maps a-z to A-Z and leaves every other byte unchanged
+UPPER_TABLE = bytes(b & 0xDF if 0x61 <= b <= 0x7A else b for b in range(256))
+
+
+@njit(cache=True)
+def _fnv1a(buf, start, end, max_length):
     """
-    Create a lookup dictionary from sequence MD5 hash to PlasticDB IDs and descriptions.
-    If verify_exact is True, the actual sequences are also stored.
-    If no_duplicates is True, only the first occurrence of each unique sequence is kept.
+    64-bit FNV-1a hash of buf[start:end], skipping line breaks and spaces.
+    Bytes are masked with 0xDF so ASCII letters hash case-insensitively.
+    Returns the hash and the number of residues hashed; hashing stops early
+    once more than max_length residues have been seen.
     """
-    seq_hash_to_records = defaultdict(list)
+    h = FNV_OFFSET_BASIS
+    length = 0
+    for j in range(start, end):
+        c = buf[j]
+        if c == 10 or c == 13 or c == 32:
+            continue
+        h = (h ^ np.uint64(c & 0xDF)) * FNV_PRIME
+        length += 1
+        if length > max_length:
+            break
+    return h, length
 
-    print(f"Processing PlasticDB file: {plasticdb_file}")
-    record_count = 0
-    duplicate_count = 0
-    start_time = time.time()
 
-    for record in SeqIO.parse(plasticdb_file, "fasta"):
-        record_count += 1
-        if record_count % 10000 == 0:
-            elapsed = time.time() - start_time
-            print(
-                f"Processed {record_count} PlasticDB sequences... ({record_count/elapsed:.2f} seqs/sec)"
-            )
+@njit(cache=True)
+def _hash_records(buf, offsets, min_length, max_length, hashes, lengths):
+    """
+    Hash the sequence of every FASTA record in buf, where record i spans
+    buf[offsets[i]:offsets[i + 1]] and starts with its header line.
+    Records that cannot be min_length to max_length residues long are not
+    fully hashed; their lengths fall outside that range.
+    """
+    for i in range(len(offsets) - 1):
+        # Skip the header line
+        j = offsets[i]
+        while j < offsets[i + 1] and buf[j] != 10:
+            j += 1
+        # The raw span bounds the residue count from above
+        if offsets[i + 1] - j < min_length:
+            hashes[i] = 0
+            lengths[i] = -1
+            continue
+        hashes[i], lengths[i] = _fnv1a(buf, j, offsets[i + 1], max_length)
 
-        seq_id = record.id
-        description = record.description
-        sequence = str(record.seq).upper()
 
-        # Use MD5 hash of sequence as key for memory efficiency
-        seq_hash = hashlib.md5(sequence.encode()).hexdigest()
+def sequence_hash(sequence):
+    """Hash an already cleaned sequence the same way _hash_records does."""
+    buf = np.frombuffer(sequence, dtype=np.uint8)
+    return int(_fnv1a(buf, 0, len(buf), len(buf))[0])
 
-        # If no_duplicates is True and we already have this sequence, skip it
-        if no_duplicates and seq_hash in seq_hash_to_records:
-            duplicate_count += 1
-            continue
 
+def record_offsets(buf):
+    """Offsets of every record header in a FASTA byte buffer, plus its end."""
+    starts = np.flatnonzero((buf[:-1] == ord("\n")) & (buf[1:] == ord(">"))) + 1
+    if len(buf) and buf[0] == ord(">"):
+        starts = np.concatenate(([0], starts))
+    return np.append(starts, len(buf)).astype(np.int64)
+
+
+def iter_fasta_blocks(fasta_file, start=0, end=None, chunk_size=CHUNK_SIZE):
+    """
+    Stream a FASTA file in binary blocks of roughly chunk_size bytes, each
+    holding only complete records.
+    If start and end are given, only the records within that byte range are read;
+    both must fall on record boundaries (see fasta_shards).
+    """
+    with open(fasta_file, "rb") as f:
+        f.seek(start)
+        remaining = end - start if end is not None else None
+        pending = b""
+        while True:
+            if remaining is None:
+                chunk = f.read(chunk_size)
+            else:
+                chunk = f.read(min(chunk_size, remaining))
+                remaining -= len(chunk)
+            if not chunk:
+                break
+            data = pending + chunk
+            cut = data.rfind(b"\n>")
+            if cut == -1:
+                pending = data
+                continue
+            yield data[: cut + 1]
+            pending = data[cut + 1 :]
+        if pending.strip():
+            yield pending
+
+
+def iter_fasta(fasta_file, start=0, end=None, chunk_size=CHUNK_SIZE):
+    """
+    Stream a FASTA file as (id, description, sequence) tuples of bytes.
+    The sequence is returned uppercased with line breaks removed, mirroring
+    the id/description split of Bio.SeqIO.
+    """
+    for block in iter_fasta_blocks(fasta_file, start, end, chunk_size):
+        for raw in block.split(b"\n>"):
+            if raw.strip():
+                yield _parse_fasta_record(raw)
+
+
+def _parse_fasta_record(raw):
+    # Only the very first record of a file still carries its leading '>'
+    if raw.startswith(b">"):
+        raw = raw[1:]
+    header, _, body = raw.partition(b"\n")
+    description = header.rstrip()
+    seq_id = (description.split(None, 1) or [b""])[0]
+    sequence = body.translate(UPPER_TABLE, delete=b"\n\r ")
+    return seq_id, description, sequence
+
+
+def fasta_shards(fasta_file, n_shards):
+    """
+    Split a FASTA file into up to n_shards (start, end) byte ranges, each
+    starting at a record header, so they can be parsed independently.
+    """
+    file_size = os.path.getsize(fasta_file)
+    boundaries = [0]
+    with open(fasta_file, "rb") as f:
+        for i in range(1, n_shards):
+            # Step back one byte so a header starting exactly at the target is found
+            f.seek(max(file_size * i // n_shards - 1, boundaries[-1]))
+            boundary = file_size
+            pending = b""
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                found = (pending + chunk).find(b"\n>")
+                if found != -1:
+                    boundary = f.tell() - len(chunk) - len(pending) + found + 1
+                    break
+                pending = chunk[-1:]
+            if boundary > boundaries[-1]:
+                boundaries.append(boundary)
+    if boundaries[-1] < file_size:
+        boundaries.append(file_size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def create_pazy_lookup(pazy_file, verify_exact=False):
+    """
+    Create a lookup dictionary from sequence FNV-1a hash to PAZy record indices.
+    PAZy is small, so this is the side kept in memory while PlasticDB is streamed.
+    Records are stored column-wise as (ids, descriptions, lengths, sequences);
+    sequences are only stored if verify_exact is True.
+    """
+    seq_hash_to_indices = defaultdict(list)
+    pazy_ids = []
+    pazy_descriptions = []
+    pazy_lengths = array("i")
+    pazy_sequences = []
+
+    print(f"Processing PAZy file: {pazy_file}")
+    for pazy_id, pazy_description, pazy_seq in iter_fasta(pazy_file):
+        # Use the 64-bit FNV-1a hash of the sequence as an integer key for memory efficiency
+        seq_hash = sequence_hash(pazy_seq)
+        seq_hash_to_indices[seq_hash].append(len(pazy_ids))
+        # Decode once here so every output row shares the same str objects
+        pazy_ids.append(pazy_id.decode())
+        pazy_descriptions.append(pazy_description.decode())
+        pazy_lengths.append(len(pazy_seq))
         if verify_exact:
-            seq_hash_to_records[seq_hash].append(
-                (seq_id, description, len(sequence), sequence)
-            )
-        else:
-            seq_hash_to_records[seq_hash].append((seq_id, description, len(sequence)))
+            pazy_sequences.append(pazy_seq)
 
-    elapsed = time.time() - start_time
-    print(
-        f"Completed processing {record_count} PlasticDB sequences in {elapsed:.2f} seconds"
+    print(f"Loaded {len(pazy_ids)} PAZy sequences")
+    print(f"Number of unique sequence hashes: {len(seq_hash_to_indices)}")
+    return seq_hash_to_indices, (
+        pazy_ids,
+        pazy_descriptions,
+        pazy_lengths,
+        pazy_sequences,
     )
-    print(f"Number of unique sequence hashes: {len(seq_hash_to_records)}")
-    if no_duplicates:
-        print(f"Removed {duplicate_count} duplicate sequences")
 
-    return seq_hash_to_records
+
+def _probe_hashes(pazy_hashes, hashes):
+    """
+    Find which hashes occur in the sorted array pazy_hashes with one vectorised
+    binary search. Returns the matching indices into hashes and their positions
+    in pazy_hashes.
+    """
+    positions = np.searchsorted(pazy_hashes, hashes)
+    found = positions < len(pazy_hashes)
+    found[found] = pazy_hashes[positions[found]] == hashes[found]
+    matched = np.flatnonzero(found)
+    return matched, positions[matched]
+
+
+def _scan_plasticdb_shard(
+    plasticdb_file, start, end, pazy_hashes, pazy_groups, pazy_columns, verify_exact
+):
+    """
+    Probe every PlasticDB record in a byte range against the PAZy lookup, given
+    as the sorted uint64 array pazy_hashes and the aligned list pazy_groups of
+    PAZy record indices (into pazy_columns) sharing each hash.
+    Returns the number of records read and, for each record whose hash is in
+    the lookup, its hash and the TSV rows it produces.
+    """
+    # Only PlasticDB sequences within the PAZy length range can match
+    pazy_lengths = pazy_columns[2]
+    min_length = min(pazy_lengths, default=0)
+    max_length = max(pazy_lengths, default=-1)
+
+    record_count = 0
+    hits = []
+    for block in iter_fasta_blocks(plasticdb_file, start, end):
+        # Hash the whole block in compiled code; Python only touches the hits
+        buf = np.frombuffer(block, dtype=np.uint8)
+        offsets = record_offsets(buf)
+        hashes = np.empty(len(offsets) - 1, dtype=np.uint64)
+        lengths = np.empty(len(offsets) - 1, dtype=np.int64)
+        _hash_records(buf, offsets, min_length, max_length, hashes, lengths)
+        record_count += len(hashes)
+
+        # Probing runs in NumPy for the whole block; Python only loops over the hits
+        in_range = np.flatnonzero((lengths >= min_length) & (lengths <= max_length))
+        matched, positions = _probe_hashes(pazy_hashes, hashes[in_range])
+        for i, position in zip(in_range[matched].tolist(), positions.tolist()):
+            plasticdb_record = block[offsets[i] : offsets[i + 1]]
+            rows = _match_rows(
+                plasticdb_record, pazy_groups[position], pazy_columns, verify_exact
+            )
+            hits.append((int(hashes[i]), rows))
+    return record_count, hits
+
+
+def _match_rows(plasticdb_record, pazy_indices, pazy_columns, verify_exact):
+    """TSV rows pairing one raw PlasticDB record with the PAZy records sharing its hash."""
+    plasticdb_id, plasticdb_desc, sequence = _parse_fasta_record(plasticdb_record)
+    pazy_ids, pazy_descriptions, pazy_lengths, pazy_sequences = pazy_columns
+
+    rows = []
+    for j in pazy_indices:
+        # A 64-bit hash collision between sequences of different length is cheap to rule out
+        if pazy_lengths[j] != len(sequence):
+            continue
+        # Verify exact sequence match
+        if verify_exact and pazy_sequences[j] != sequence:
+            continue  # Skip if sequences don't match exactly
+
+        rows.append(
+            f"{pazy_ids[j]}\t{pazy_descriptions[j]}\t{plasticdb_id.decode()}\t{plasticdb_desc.decode()}\t{len(sequence)}\n"
+        )
+    return rows
 
 
-def find_matches_in_pazy(plasticdb_lookup, pazy_file, output_file, verify_exact=False):
+def cross_reference(
+    plasticdb_file,
+    pazy_file,
+    output_file,
+    verify_exact=False,
+    no_duplicates=False,
+    workers=1,
+):
     """
-    Find PAZy sequences that match with PlasticDB sequences and write to output TSV.
+    Stream PlasticDB once, probing each sequence against the PAZy lookup, and write
+    matches to the output TSV. PlasticDB is never held in memory; it is split into
+    shards that are scanned by up to `workers` processes and written in file order.
+    Keys are 64-bit integers; without verify_exact a (very unlikely) hash collision
+    between sequences of equal length would be reported as a match.
+    If no_duplicates is True, only the first occurrence of each PlasticDB sequence is kept.
     """
-    with open(output_file, "w") as out_f:
+    pazy_lookup, pazy_columns = create_pazy_lookup(pazy_file, verify_exact)
+    pazy_hashes = np.sort(np.fromiter(pazy_lookup, dtype=np.uint64))
+    pazy_groups = [pazy_lookup[seq_hash] for seq_hash in pazy_hashes.tolist()]
+    seen_hashes = set()
+
+    print(f"Processing PlasticDB file: {plasticdb_file} with {workers} worker(s)")
+    shards = fasta_shards(plasticdb_file, workers * SHARDS_PER_WORKER)
+    scan_shard = partial(
+        _scan_plasticdb_shard,
+        plasticdb_file,
+        pazy_hashes=pazy_hashes,
+        pazy_groups=pazy_groups,
+        pazy_columns=pazy_columns,
+        verify_exact=verify_exact,
+    )
+
+    with open(output_file, "w", buffering=1 << 20) as out_f, ProcessPoolExecutor(
+        max_workers=workers
+    ) as executor:
         # Write header
         out_f.write(
             "PAZy_ID\tPAZy_Description\tPlasticDB_ID\tPlasticDB_Description\tSequence_Length\n"
         )
 
-        print(f"Processing PAZy file: {pazy_file}")
         record_count = 0
         match_count = 0
+        duplicate_count = 0
+        rows = []
         start_time = time.time()
 
-        for record in SeqIO.parse(pazy_file, "fasta"):
-            record_count += 1
-            if record_count % 1000 == 0:
-                elapsed = time.time() - start_time
-                print(
-                    f"Processed {record_count} PAZy sequences, found {match_count} matches... ({record_count/elapsed:.2f} seqs/sec)"
-                )
-
-            pazy_id = record.id
-            pazy_description = record.description
-            pazy_seq = str(record.seq).upper()
-
-            seq_hash = hashlib.md5(pazy_seq.encode()).hexdigest()
-
-            if seq_hash in plasticdb_lookup:
-                for plasticdb_record in plasticdb_lookup[seq_hash]:
-                    if verify_exact:
-                        plasticdb_id, plasticdb_desc, seq_len, plasticdb_seq = (
-                            plasticdb_record
-                        )
-                        # Verify exact sequence match
-                        if pazy_seq != plasticdb_seq:
-                            continue  # Skip if sequences don't match exactly
-                    else:
-                        plasticdb_id, plasticdb_desc, seq_len = plasticdb_record
-
-                    out_f.write(
-                        f"{pazy_id}\t{pazy_description}\t{plasticdb_id}\t{plasticdb_desc}\t{seq_len}\n"
-                    )
-                    match_count += 1
+        # Results come back in shard order, so "first occurrence" follows the file
+        shard_results = executor.map(scan_shard, *zip(*shards))
+        for shard_number, (shard_record_count, hits) in enumerate(shard_results, 1):
+            record_count += shard_record_count
+            for seq_hash, hit_rows in hits:
+                # Only sequences shared with PAZy can be written, so only those need tracking
+                if no_duplicates:
+                    if seq_hash in seen_hashes:
+                        duplicate_count += 1
+                        continue
+                    seen_hashes.add(seq_hash)
+                rows.extend(hit_rows)
+                match_count += len(hit_rows)
+
+            if len(rows) >= WRITE_BATCH_SIZE:
+                out_f.write("".join(rows))
+                rows.clear()
+
+            elapsed = time.time() - start_time
+            print(
+                f"Processed {shard_number}/{len(shards)} shards ({record_count} PlasticDB sequences), found {match_count} matches... ({record_count/elapsed:.2f} seqs/sec)"
+            )
+
+        out_f.write("".join(rows))
 
     elapsed = time.time() - start_time
     print(
-        f"Completed processing {record_count} PAZy sequences in {elapsed:.2f} seconds"
+        f"Completed processing {record_count} PlasticDB sequences in {elapsed:.2f} seconds"
     )
+    if no_duplicates:
+        print(f"Skipped {duplicate_count} duplicate PlasticDB matches")
     print(f"Found {match_count} matches")
     return match_count
 
@@ -123,23 +357,28 @@ def main():
     parser.add_argument(
         "--verify-exact",
         action="store_true",
-        help="Verify exact sequence matches (more memory intensive)",
+        help="Verify exact sequence matches",
     )
     parser.add_argument(
         "--noduplicates",
         action="store_true",
         help="Remove duplicate sequences from PlasticDB (keeps only first occurrence)",
     )
-    args = parser.parse_args()
-
-    # Create lookup from PlasticDB
-    plasticdb_lookup = create_plasticdb_lookup(
-        args.plasticdb, args.verify_exact, args.noduplicates
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Number of processes used to scan PlasticDB (default: number of CPUs)",
     )
+    args = parser.parse_args()
 
-    # Find matches in PAZy
-    match_count = find_matches_in_pazy(
-        plasticdb_lookup, args.pazy, args.output, args.verify_exact
+    match_count = cross_reference(
+        args.plasticdb,
+        args.pazy,
+        args.output,
+        args.verify_exact,
+        args.noduplicates,
+        args.workers,
     )
 
     print(f"{match_count} cross-references written to {args.output}")
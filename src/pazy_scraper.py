@@ -1,5 +1,11 @@
 import requests
-from bs4 import BeautifulSoup
+import requests_cache
+import aiohttp
+import aiohttp_client_cache
+import asyncio
+from collections import deque
+from itertools import islice
+import lxml.html
 import time
 from urllib.parse import urljoin
 import warnings
@@ -12,6 +18,20 @@ import re  # Added for regex pattern matching
 # Disable SSL warnings (as in the original script)
 warnings.simplefilter("ignore", InsecureRequestWarning)
 
+# Polymer abbreviation in parentheses, e.g. "PLA" in "Polylactic acid (PLA)"
+ABBR_RE = re.compile(r"\(([A-Z]+)\)")
+# Sequence databases recognised in enzyme ID links
+DB_LINK_RE = re.compile(r"uniprot|genbank|ncbi\.nlm\.nih\.gov|ebi\.ac\.uk", re.I)
+# Concurrent FASTA downloads allowed per sequence database
+FASTA_CONCURRENCY = {"UniProt": 8, "GenBank": 3, "MGnify": 4}
+# Minimum seconds between network request starts per sequence database (NCBI allows 3 requests/s without an API key)
+FASTA_MIN_INTERVAL = {"UniProt": 0.1, "GenBank": 0.34, "MGnify": 0.2}
+# FASTA downloads scheduled ahead of the one being written, bounding texts held in memory
+FASTA_LOOKAHEAD = 32
+# Cached HTTP responses are reused for a week
+HTTP_CACHE_EXPIRE = 7 * 24 * 3600
+INLINE_TABLE_XPATH = '//table[contains(concat(" ", normalize-space(@class), " "), " inline ")]'
+
 
 def setup_argparse():
     parser = argparse.ArgumentParser(
@@ -23,6 +43,16 @@ def setup_argparse():
         help="Path to the output directory (default: current directory)",
         default=".",
     )
+    parser.add_argument(
+        "--cache",
+        help="Path prefix of the on-disk HTTP cache (default: pazy_http_cache)",
+        default="pazy_http_cache",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Fetch everything from the network without using the HTTP cache",
+    )
     return parser.parse_args()
 
 
@@ -45,12 +75,13 @@ def setup_logging(log_path=None):
 
 
 def perform_request_with_retries(url, logger, max_retries=3, base_delay=1):
-    """Fetches URL text with retries and exponential backoff."""
+    """Fetches URL text with retries and exponential backoff.
+    Returns the text (None on failure) and whether it was served from the HTTP cache."""
     for attempt in range(1, max_retries + 1):
         try:
             response = requests.get(url, verify=False, timeout=10)
             response.raise_for_status()
-            return response.text
+            return response.text, getattr(response, "from_cache", False)
         except Exception as e:
             logger.warning(f"Attempt {attempt}: Error fetching {url}: {e}")
             if attempt < max_retries:
@@ -58,50 +89,115 @@ def perform_request_with_retries(url, logger, max_retries=3, base_delay=1):
                 logger.info(f"Retrying after {delay} seconds...")
                 time.sleep(delay)
     logger.error(f"Failed to fetch URL: {url} after {max_retries} attempts.")
+    return None, False
+
+
+def make_pacer(min_interval):
+    """Returns a coroutine function that waits until at least min_interval seconds
+    have passed since the previous network request start it allowed."""
+    lock = asyncio.Lock()
+    next_start = 0.0
+
+    async def pace():
+        nonlocal next_start
+        async with lock:
+            loop = asyncio.get_running_loop()
+            delay = next_start - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            next_start = loop.time() + min_interval
+
+    return pace
+
+
+async def is_cached(session, url):
+    """Whether a GET of url would be answered from an unexpired aiohttp-client-cache entry."""
+    if not isinstance(session, aiohttp_client_cache.CachedSession):
+        return False
+    key = session.cache.create_key("GET", url)
+    return await session.cache.get_response(key) is not None
+
+
+async def perform_request_with_retries_async(
+    session, url, logger, max_retries=3, base_delay=1, pace=None
+):
+    """Async variant of perform_request_with_retries using a shared aiohttp session.
+    If pace is given, it is awaited before each attempt that goes to the network (not
+    those answered from the HTTP cache), spacing out real request starts.
+    HTTP 429 responses are retried after the server's Retry-After delay, if it gives one."""
+    for attempt in range(1, max_retries + 1):
+        delay = base_delay * (2 ** (attempt - 1))
+        try:
+            # Responses already in the HTTP cache never reach the server
+            if pace and not await is_cached(session, url):
+                await pace()
+            async with session.get(
+                url, ssl=False, timeout=aiohttp.ClientTimeout(total=10)
+            ) as response:
+                if response.status == 429:
+                    retry_after = response.headers.get("Retry-After", "")
+                    if retry_after.isdigit():
+                        delay = max(delay, int(retry_after))
+                response.raise_for_status()
+                return await response.text()
+        except Exception as e:
+            logger.warning(f"Attempt {attempt}: Error fetching {url}: {e}")
+            if attempt < max_retries:
+                logger.info(f"Retrying after {delay} seconds...")
+                await asyncio.sleep(delay)
+    logger.error(f"Failed to fetch URL: {url} after {max_retries} attempts.")
     return None
 
 
+def element_text(element, separator=""):
+    """Joins the stripped text of an element, like BeautifulSoup's get_text(strip=True)."""
+    return separator.join(
+        text.strip() for text in element.itertext() if text.strip()
+    )
+
+
 def fetch_polymer_links(base_url, landing_url, logger):
     logger.info(f"Fetching polymer links from {landing_url}")
-    response_text = perform_request_with_retries(
+    response_text, _ = perform_request_with_retries(
         landing_url, logger, max_retries=5, base_delay=1
     )
     if not response_text:
         logger.error("Failed to retrieve landing page.")
         return []
-    soup = BeautifulSoup(response_text, "html.parser")
-    table = soup.find("table", {"class": "inline"})
+    tables = lxml.html.fromstring(response_text).xpath(INLINE_TABLE_XPATH)
     polymer_links = []
-    if table:
-        for a in table.find_all("a", {"class": "wikilink1"}):
+    if tables:
+        for a in tables[0].xpath(
+            './/a[contains(concat(" ", normalize-space(@class), " "), " wikilink1 ")]'
+        ):
             href = a.get("href")
             if href and "id=" in href:
                 full_url = urljoin(base_url, href)
-                polymer_name = a.get_text(strip=True)
+                polymer_name = element_text(a)
                 polymer_links.append((polymer_name, full_url))
     logger.info(f"Found {len(polymer_links)} polymer types")
     return polymer_links
 
 
 def fetch_enzyme_data(polymer_name, polymer_url, logger):
+    """Returns the enzyme entries of a polymer page and whether the page came from the HTTP cache."""
     logger.info(f"Processing polymer: {polymer_name}")
     enzyme_data = []
-    page_text = perform_request_with_retries(
+    page_text, from_cache = perform_request_with_retries(
         polymer_url, logger, max_retries=3, base_delay=1
     )
     if not page_text:
         logger.error(f"Failed to retrieve {polymer_name} page.")
-        return enzyme_data
+        return enzyme_data, from_cache
 
-    soup = BeautifulSoup(page_text, "html.parser")
-    table = soup.find("table", {"class": "inline"})
-    if not table:
+    tables = lxml.html.fromstring(page_text).xpath(INLINE_TABLE_XPATH)
+    if not tables:
         logger.warning(f"No table found on {polymer_name} page.")
-        return enzyme_data
+        return enzyme_data, from_cache
 
     # FIX: Improved polymer_id extraction
     # Look for abbreviation in parentheses first
-    abbr_match = re.search(r"\(([A-Z]+)\)", polymer_name)
+    abbr_match = ABBR_RE.search(polymer_name)
     if abbr_match:
         polymer_id = abbr_match.group(1)
     elif polymer_name.lower().startswith("polyethylene terephthalate"):
@@ -111,35 +207,36 @@ def fetch_enzyme_data(polymer_name, polymer_url, logger):
     else:
         polymer_id = polymer_name[:3].upper()
 
-    rows = table.find_all("tr")
+    rows = tables[0].xpath(".//tr")
     for row in rows[1:]:  # Skip header row explicitly
-        cells = row.find_all(["td", "th"])
+        cells = row.xpath("./td|./th")
         if len(cells) < 6:
             continue  # Skip incomplete or header rows
-        host_enzyme_gene = cells[0].get_text(separator=" ", strip=True)
-        ec_number = cells[1].get_text(strip=True)
-        references = "; ".join(a.get_text(strip=True) for a in cells[2].find_all("a"))
+        host_enzyme_gene = element_text(cells[0], separator=" ")
+        ec_number = element_text(cells[1])
+        references = "; ".join(element_text(a) for a in cells[2].xpath(".//a"))
         id_cell = cells[3]
 
         # Extract Database ID and type
         db_type, database_id, database_link = "", "", ""
-        for a in id_cell.find_all("a"):
+        for a in id_cell.xpath(".//a"):
             href = a.get("href", "")
-            if "uniprot" in href.lower():
+            link_text = element_text(a)
+            # One regex pass per href; UniProt wins over GenBank over MGnify
+            db_hosts = {host.lower() for host in DB_LINK_RE.findall(href)}
+            if "uniprot" in db_hosts:
                 db_type = "UniProt"
-                database_id = a.get_text(strip=True).split("_")[0]
+                database_id = link_text.split("_")[0]
                 database_link = href
                 break
-            elif "genbank" in href.lower() or "ncbi.nlm.nih.gov" in href.lower():
+            elif "genbank" in db_hosts or "ncbi.nlm.nih.gov" in db_hosts:
                 db_type = "GenBank"
-                database_id = a.get_text(strip=True)
+                database_id = link_text
                 database_link = href
                 break
-            elif (
-                "ebi.ac.uk" in href.lower() or "mgyp" in a.get_text(strip=True).lower()
-            ):
+            elif "ebi.ac.uk" in db_hosts or "mgyp" in link_text.lower():
                 db_type = "MGnify"
-                database_id = a.get_text(strip=True)
+                database_id = link_text
                 database_link = href
                 break
             else:
@@ -169,13 +266,13 @@ def fetch_enzyme_data(polymer_name, polymer_url, logger):
                 "database_link": database_link,
             }
         )
-        time.sleep(1)
     logger.info(f"Found {len(enzyme_data)} enzyme entries for {polymer_name}")
-    return enzyme_data
+    return enzyme_data, from_cache
 
 
-def fetch_fasta(database_type, database_id, logger):
-    logger.info(f"Fetching FASTA for {database_id} from {database_type}")
+async def fetch_fasta_async(
+    session, semaphores, pacers, database_type, database_id, logger
+):
     if database_type == "UniProt":
         # Use UniProt REST endpoint for improved reliability
         fasta_url = f"https://rest.uniprot.org/uniprotkb/{database_id}.fasta"
@@ -189,12 +286,100 @@ def fetch_fasta(database_type, database_id, logger):
     else:
         logger.warning(f"Unknown database type for ID: {database_id}")
         return ""
-    fasta_text = perform_request_with_retries(
-        fasta_url, logger, max_retries=3, base_delay=1
-    )
+    # Per-database semaphores cap requests in flight; pacers space out network request starts
+    async with semaphores[database_type]:
+        logger.info(f"Fetching FASTA for {database_id} from {database_type}")
+        fasta_text = await perform_request_with_retries_async(
+            session,
+            fasta_url,
+            logger,
+            max_retries=3,
+            base_delay=1,
+            pace=pacers[database_type],
+        )
     return fasta_text if fasta_text else ""
 
 
+async def iter_fastas(enzymes, logger, cache_path=None):
+    """Fetches the FASTA of every enzyme concurrently, yielding (enzyme, fasta_text) in input
+    order as soon as each one is available. At most FASTA_LOOKAHEAD downloads are scheduled
+    ahead of the consumer. Responses are cached in an SQLite file at cache_path, if given."""
+    semaphores = {
+        database_type: asyncio.Semaphore(limit)
+        for database_type, limit in FASTA_CONCURRENCY.items()
+    }
+    pacers = {
+        database_type: make_pacer(min_interval)
+        for database_type, min_interval in FASTA_MIN_INTERVAL.items()
+    }
+    if cache_path:
+        session = aiohttp_client_cache.CachedSession(
+            cache=aiohttp_client_cache.SQLiteBackend(
+                cache_path, expire_after=HTTP_CACHE_EXPIRE
+            )
+        )
+    else:
+        session = aiohttp.ClientSession()
+    async with session:
+        remaining = iter(enzymes)
+        pending = deque()
+
+        def schedule():
+            # Top the window back up to FASTA_LOOKAHEAD downloads
+            for enzyme in islice(remaining, FASTA_LOOKAHEAD - len(pending)):
+                task = asyncio.ensure_future(
+                    fetch_fasta_async(
+                        session,
+                        semaphores,
+                        pacers,
+                        enzyme["database_type"],
+                        enzyme["database_id"],
+                        logger,
+                    )
+                )
+                pending.append((enzyme, task))
+
+        try:
+            schedule()
+            while pending:
+                enzyme, task = pending.popleft()
+                fasta_text = await task
+                schedule()
+                yield enzyme, fasta_text
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+
+async def write_sequences(enzymes, fasta_file_path, logger, cache_path=None):
+    """Streams the FASTA of every enzyme to fasta_file_path as it arrives, prefixing
+    headers with an internal ID. Returns the enzymes with a sequence and the number
+    of enzymes without one."""
+    successful_enzymes = []
+    missing_sequence_count = 0
+    internal_id_counter = 1
+
+    with open(fasta_file_path, "w", encoding="utf-8") as fasta_file:
+        async for enzyme, fasta_text in iter_fastas(enzymes, logger, cache_path):
+            if fasta_text:
+                # Prepend internal ID to the FASTA header
+                lines = fasta_text.splitlines()
+                if lines and lines[0].startswith(">"):
+                    lines[0] = (
+                        f">{internal_id_counter}|{enzyme['polymer_id']}_{lines[0][1:]}"
+                    )
+                enzyme["internal_id"] = str(internal_id_counter)
+                internal_id_counter += 1
+                successful_enzymes.append(enzyme)
+                fasta_file.write("\n".join(lines) + "\n")
+            else:
+                missing_sequence_count += 1
+                logger.warning(
+                    f"Sequence not found for enzyme: {enzyme['enzyme_name']} with ID: {enzyme['database_id']}"
+                )
+    return successful_enzymes, missing_sequence_count
+
+
 def main():
     args = setup_argparse()
     logger = setup_logging(args.log)
@@ -202,6 +387,12 @@ def main():
     output_dir = args.output
     os.makedirs(output_dir, exist_ok=True)
 
+    # Serve repeated runs from disk; requests.get calls go through the cache once installed
+    fasta_cache_path = None
+    if not args.no_cache:
+        requests_cache.install_cache(args.cache, expire_after=HTTP_CACHE_EXPIRE)
+        fasta_cache_path = f"{args.cache}_fasta.sqlite"
+
     base_url = "https://pazy.eu"
     landing_url = urljoin(base_url, "doku.php?id=start")
 
@@ -210,37 +401,17 @@ def main():
 
     all_enzyme_data = []
     for polymer_name, polymer_url in polymer_links:
-        enzymes = fetch_enzyme_data(polymer_name, polymer_url, logger)
+        enzymes, from_cache = fetch_enzyme_data(polymer_name, polymer_url, logger)
         all_enzyme_data.extend(enzymes)
-        time.sleep(2)
+        # Pages served from the HTTP cache did not touch the server
+        if not from_cache:
+            time.sleep(2)
 
-    # Process enzyme entries to fetch sequences and compile output
-    successful_enzymes = []
-    missing_sequence_count = 0
-    internal_id_counter = 1
-    sequences_output = ""
-
-    for enzyme in all_enzyme_data:
-        fasta_text = fetch_fasta(enzyme["database_type"], enzyme["database_id"], logger)
-        if fasta_text:
-            # Prepend internal ID to the FASTA header
-            lines = fasta_text.splitlines()
-            if lines and lines[0].startswith(">"):
-                lines[0] = (
-                    f">{internal_id_counter}|{enzyme['polymer_id']}_{lines[0][1:]}"
-                )
-            modified_fasta = "\n".join(lines)
-            enzyme["fasta"] = modified_fasta
-            enzyme["internal_id"] = str(internal_id_counter)
-            internal_id_counter += 1
-            successful_enzymes.append(enzyme)
-            sequences_output += modified_fasta + "\n"
-        else:
-            missing_sequence_count += 1
-            logger.warning(
-                f"Sequence not found for enzyme: {enzyme['enzyme_name']} with ID: {enzyme['database_id']}"
-            )
-        time.sleep(1)
+    # Fetch sequences and write them to file as they arrive
+    fasta_file_path = os.path.join(output_dir, "PAZy_sequences.fasta")
+    successful_enzymes, missing_sequence_count = asyncio.run(
+        write_sequences(all_enzyme_data, fasta_file_path, logger, fasta_cache_path)
+    )
 
     # Write metadata output for enzymes with a valid sequence.
     metadata_file_path = os.path.join(output_dir, "PAZy_metadata.tsv")
@@ -262,11 +433,6 @@ def main():
             ]
             meta_file.write("\t".join(meta_row) + "\n")
 
-    # Write FASTA sequences to file.
-    fasta_file_path = os.path.join(output_dir, "PAZy_sequences.fasta")
-    with open(fasta_file_path, "w", encoding="utf-8") as fasta_file:
-        fasta_file.write(sequences_output)
-
     logger.info(
         f"Scraping complete. Metadata saved to {metadata_file_path} and sequences to {fasta_file_path}."
     )